@@ -6,20 +6,13 @@ cd /d "%~dp0"
 set "LOG_FILE=aq_widget_log.txt"
 
 :loop
-echo [LOOP %date% %time%] >> "%LOG_FILE%"
+echo [START %date% %time%] >> "%LOG_FILE%"
 
+rem aq_widget.py runs as a daemon: it updates every UPDATE_INTERVAL seconds
+rem and refreshes Rainmeter itself. Restart it if it ever exits.
 python "%~dp0aq_widget.py" >> "%LOG_FILE%" 2>&1
 
-
-set "RM_EXE=%ProgramFiles%\Rainmeter\Rainmeter.exe"
-if not exist "%RM_EXE%" set "RM_EXE=%ProgramFiles(x86)%\Rainmeter\Rainmeter.exe"
-
-if exist "%RM_EXE%" (
-    "%RM_EXE%" !RefreshApp >> "%LOG_FILE%" 2>&1
-) else (
-    echo [WARN] Rainmeter.exe not found, skipping refresh >> "%LOG_FILE%"
-)
-
-timeout /t 300 /nobreak >nul
+echo [EXIT %date% %time%] restarting in 60 s >> "%LOG_FILE%"
+timeout /t 60 /nobreak >nul
 
 goto loop
@@ -1,8 +1,27 @@
 import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timezone
-from math import inf
+from math import inf, radians, sin, cos, floor, ceil, log10
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # ========= SETTINGS =========
 
@@ -28,6 +47,10 @@ LOCATIONS = {
 SENSOR_BASE_URL = "https://data.sensor.community/airrohr/v1/sensor/{sensor_id}/"
 RADIUS_KM = 2          # radius (km) around the point for Sensor.Community
 HOURS_HISTORY = 24     # how many hours of history to store + plot
+UPDATE_INTERVAL = 300  # seconds between updates when running as a daemon
+HISTORY_SAVE_EVERY = 2 # daemon writes the history file every N updates; up to N-1 can be lost
+GRAPH_BACKEND = "pillow"  # "pillow" (lightweight) or "matplotlib"
+SC_CACHE_TTL = 120     # seconds a cached Sensor.Community response is reused without a request
 
 RAINMETER_RESOURCES = (
     Path.home()
@@ -48,83 +71,243 @@ GRAPH_FILE_VANYA = RAINMETER_RESOURCES / "aqi_graph_vanya.png"
 
 # ========= SENSOR.COMMUNITY =========
 
-def fetch_sensor_data(lat: float, lon: float, sensor_id: int | None = None, radius_km: int = 2):
+# One pooled keep-alive session, so repeated requests to data.sensor.community
+# reuse the TCP/TLS connection instead of handshaking every time.
+SESSION = requests.Session()
+SESSION.headers["Accept-Encoding"] = "gzip, deflate"
+SESSION.headers["User-Agent"] = "hel-aqi/1.0"
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=2,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+))
+
+def compact_entries(data):
     """
-    Fetches data from Sensor.Community using filter/area.
-    If sensor_id is provided — uses the latest entry for that sensor.
-    Otherwise — picks the nearest sensor.
-    Returns (pm25, pm10) in µg/m³ or (None, None).
+    Keeps only the fields fetch_sensor_data reads from Sensor.Community
+    entries (sensor id, timestamp, location, PM values), so the cached
+    copy is a fraction of the raw response and quicker to parse again.
     """
-    url = f"https://data.sensor.community/airrohr/v1/filter/area={lat},{lon},{radius_km}"
-    resp = requests.get(url, timeout=15)
+    if not isinstance(data, list):
+        return data
+    compact = []
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        get = entry.get
+        loc = get("location") or {}
+        compact.append({
+            "sensor": {"id": (get("sensor") or {}).get("id")},
+            "timestamp": get("timestamp") or get("timestamp_measured"),
+            "location": {"latitude": loc.get("latitude"), "longitude": loc.get("longitude")},
+            "sensordatavalues": [
+                {"value_type": sv.get("value_type"), "value": sv.get("value")}
+                for sv in get("sensordatavalues") or []
+            ],
+        })
+    return compact
+
+
+def read_cache(cache_file: Path) -> tuple[bool, object]:
+    """Returns (True, data) for a readable cache file, (False, None) if missing or corrupt."""
+    try:
+        return True, parse_json(cache_file.read_bytes())
+    except (OSError, ValueError):
+        return False, None
+
+
+def get_json_cached(url: str, cache_file: Path, compact=None):
+    """
+    GETs url as JSON and keeps the parsed result in cache_file
+    (ETag / Last-Modified go to a .meta sidecar next to it).
+    A cache younger than SC_CACHE_TTL is used without any request;
+    an older one is revalidated with a conditional GET, and a 304 reuses it.
+    A cache that can't be parsed is treated as missing.
+    If given, compact(data) is applied to fresh responses before caching.
+    """
+    meta_file = cache_file.with_suffix(".meta")
+    headers = {}
+
+    if cache_file.exists():
+        if time.time() - cache_file.stat().st_mtime < SC_CACHE_TTL:
+            ok, data = read_cache(cache_file)
+            if ok:
+                return data
+        else:
+            meta = load_json(meta_file, {})
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+    resp = SESSION.get(url, headers=headers, timeout=15, stream=False)
+    if resp.status_code == 304:
+        ok, data = read_cache(cache_file)
+        if ok:
+            cache_file.touch()
+            return data
+        # Cached body is gone or unusable: fetch it in full
+        print(f"[SC] Cache {cache_file.name} unreadable, refetching")
+        resp = SESSION.get(url, timeout=15, stream=False)
     resp.raise_for_status()
-    data = resp.json()
 
-    if not isinstance(data, list) or not data:
-        print(f"[SC] No data for {lat},{lon}")
-        return None, None
+    data = parse_json(resp.content)
+    if compact is not None:
+        data = compact(data)
+    # Always rewritten (not write_if_changed): the write restarts the TTL,
+    # and the body must be on disk for the next 304
+    write_atomic(cache_file, dump_json(data))
+    save_json(meta_file, {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    })
+    return data
 
-    def extract_pm(entry):
-        pm25 = None
-        pm10 = None
-        for sv in entry.get("sensordatavalues", []):
-            vt = sv.get("value_type")
-            val = sv.get("value")
-            try:
-                val = float(val)
-            except (TypeError, ValueError):
-                continue
 
-            if vt in ("P2", "SDS_P2", "PM2.5", "pm2.5"):
-                pm25 = val
-            elif vt in ("P1", "SDS_P1", "PM10", "pm10"):
-                pm10 = val
-        return pm25, pm10
+def fetch_area(lat: float, lon: float, radius_km: int) -> list:
+    """
+    Fetches all sensor entries within radius_km of (lat, lon)
+    from Sensor.Community filter/area (cached, see get_json_cached).
+    """
+    url = f"https://data.sensor.community/airrohr/v1/filter/area={lat},{lon},{radius_km}"
+    cache_file = RAINMETER_RESOURCES / f"sc_cache_{lat}_{lon}_{radius_km}.bin"
+    data = get_json_cached(url, cache_file, compact=compact_entries)
+    return data if isinstance(data, list) else []
 
-    candidate = None
 
-    # 1) Try to take the correct sensor_id if provided
-    if sensor_id is not None:
-        latest_ts = None
-        for entry in data:
-            s = entry.get("sensor", {})
-            if s.get("id") != sensor_id:
-                continue
-            ts = entry.get("timestamp") or entry.get("timestamp_measured")
+def fetch_sensor(sensor_id: int) -> list:
+    """
+    Fetches the recent entries of a single sensor (cached, see get_json_cached).
+    Returns [] if the sensor is unknown, has no data or the request fails.
+    """
+    url = SENSOR_BASE_URL.format(sensor_id=sensor_id)
+    cache_file = RAINMETER_RESOURCES / f"sc_cache_sensor_{sensor_id}.bin"
+    try:
+        data = get_json_cached(url, cache_file, compact=compact_entries)
+    except requests.RequestException as e:
+        print(f"[SC] Sensor {sensor_id} unavailable: {e}")
+        return []
+    return data if isinstance(data, list) else []
+
+
+def point_trig(lat: float, lon: float) -> tuple[float, float, float]:
+    """(lat, lon in radians, cos(lat)) — what the haversine ranking needs of a point."""
+    lat_r = radians(lat)
+    return lat_r, radians(lon), cos(lat_r)
+
+# Fixed per location, so computed once
+LOCATION_TRIG = {key: point_trig(cfg["lat"], cfg["lon"]) for key, cfg in LOCATIONS.items()}
+
+
+def select_sensor(data: list, lat: float, lon: float,
+                  sensor_id: int | None = None, nearest: bool = True,
+                  trig: tuple[float, float, float] | None = None):
+    """
+    Picks the latest entry for sensor_id if provided and present,
+    otherwise (if nearest) the entry closest to (lat, lon).
+    trig is point_trig(lat, lon) if already known.
+    Returns the entry or None.
+    """
+    # Haversine distance is 2*R*atan2(sqrt(A), sqrt(1-A)), which is
+    # monotonic in A, so ranking by A alone picks the same sensor.
+    lat_r, lon_r, cos_lat = trig or point_trig(lat, lon)
+
+    # Single pass over the entries:
+    # 1) track the latest entry for sensor_id if provided
+    # 2) until one is found, rank entries by distance for the nearest-sensor fallback
+    candidate = None
+    latest_ts = None
+    best = None
+    best_A = inf
+    located = []
+    lats = []
+    lons = []
+    for entry in data:
+        get = entry.get
+        if sensor_id is not None and get("sensor", {}).get("id") == sensor_id:
+            ts = get("timestamp") or get("timestamp_measured")
             if ts and (latest_ts is None or ts > latest_ts):
                 latest_ts = ts
                 candidate = entry
+        if candidate is not None or not nearest:
+            continue
 
-    # 2) Otherwise: pick the nearest sensor
-    if candidate is None:
-        from math import radians, sin, cos, sqrt, atan2
-
-        def dist_km(a_lat, a_lon, b_lat, b_lon):
-            R = 6371.0
-            dlat = radians(b_lat - a_lat)
-            dlon = radians(b_lon - a_lon)
-            A = (sin(dlat / 2) ** 2 +
-                 cos(radians(a_lat)) * cos(radians(b_lat)) * sin(dlon / 2) ** 2)
-            c = 2 * atan2(sqrt(A), sqrt(1 - A))
-            return R * c
-
-        best = None
-        best_d = float("inf")
-        for entry in data:
-            loc = entry.get("location", {})
-            slat = loc.get("latitude")
-            slon = loc.get("longitude")
-            try:
-                slat = float(slat)
-                slon = float(slon)
-            except (TypeError, ValueError):
-                continue
-
-            d = dist_km(lat, lon, slat, slon)
-            if d < best_d:
-                best_d = d
+        loc = get("location", {})
+        try:
+            slat = float(loc.get("latitude"))
+            slon = float(loc.get("longitude"))
+        except (TypeError, ValueError):
+            continue
+
+        if np is not None:
+            located.append(entry)
+            lats.append(slat)
+            lons.append(slon)
+        else:
+            slat = radians(slat)
+            A = (sin((slat - lat_r) / 2) ** 2 +
+                 cos_lat * cos(slat) * sin((radians(slon) - lon_r) / 2) ** 2)
+            if A < best_A:
+                best_A = A
                 best = entry
-        candidate = best
+
+    if candidate is not None or not nearest:
+        return candidate
+
+    # Otherwise: pick the nearest sensor
+    if located:
+        slat = np.radians(np.array(lats, dtype=np.float64))
+        slon = np.radians(np.array(lons, dtype=np.float64))
+        A = (np.sin((slat - lat_r) / 2) ** 2 +
+             cos_lat * np.cos(slat) * np.sin((slon - lon_r) / 2) ** 2)
+        best = located[int(np.argmin(A))]
+    return best
+
+
+# Sensor.Community value_type -> which PM value it is
+PM_VALUE_TYPES = {
+    "P2": "pm25", "SDS_P2": "pm25", "PM2.5": "pm25", "pm2.5": "pm25",
+    "P1": "pm10", "SDS_P1": "pm10", "PM10": "pm10", "pm10": "pm10",
+}
+
+def extract_pm(entry) -> tuple[float | None, float | None]:
+    """Returns (pm25, pm10) from an entry's sensordatavalues (None if missing)."""
+    pm = {"pm25": None, "pm10": None}
+    for sv in entry.get("sensordatavalues", []):
+        kind = PM_VALUE_TYPES.get(sv.get("value_type"))
+        if kind is None:
+            continue
+        try:
+            pm[kind] = float(sv.get("value"))
+        except (TypeError, ValueError):
+            continue
+    return pm["pm25"], pm["pm10"]
+
+
+def fetch_sensor_data(lat: float, lon: float, sensor_id: int | None = None, radius_km: int = 2,
+                      trig: tuple[float, float, float] | None = None):
+    """
+    Fetches data from Sensor.Community.
+    If sensor_id is provided — uses the latest entry for that sensor
+    from its own endpoint (SENSOR_BASE_URL).
+    Otherwise, or if that returns nothing — picks the nearest sensor
+    within radius_km using filter/area (trig: see select_sensor).
+    Returns (pm25, pm10) in µg/m³ or (None, None).
+    """
+    candidate = None
+
+    # 1) Known sensor: its own endpoint returns just a few rows
+    if sensor_id is not None:
+        data = fetch_sensor(sensor_id)
+        candidate = select_sensor(data, lat, lon, sensor_id, nearest=False)
+
+    # 2) Otherwise: the whole radius, by id or nearest
+    if candidate is None:
+        data = fetch_area(lat, lon, radius_km)
+        if not data:
+            print(f"[SC] No data for {lat},{lon}")
+            return None, None
+        candidate = select_sensor(data, lat, lon, sensor_id, trig=trig)
 
     if candidate is None:
         print(f"[SC] Failed to select sensor for {lat},{lon}")
@@ -155,36 +338,51 @@ PM10_BREAKPOINTS = [
     (425,604,301,500),
 ]
 
-def calc_aqi_from_breakpoints(C: float, table) -> int | None:
+def breakpoint_lookup(table) -> tuple[list, list]:
+    """
+    Turns a breakpoint table into (upper bounds, segments) for bisect:
+    segment i is (Clow, slope, Ilow) of the i-th row.
+    """
+    highs = [Chigh for _, Chigh, _, _ in table]
+    segments = [(Clow, (Ihigh - Ilow) / (Chigh - Clow), Ilow)
+                for Clow, Chigh, Ilow, Ihigh in table]
+    return highs, segments
+
+PM25_LOOKUP = breakpoint_lookup(PM25_BREAKPOINTS)
+PM10_LOOKUP = breakpoint_lookup(PM10_BREAKPOINTS)
+
+def calc_aqi_from_breakpoints(C: float, lookup) -> int | None:
     if C is None:
         return None
-    for Clow, Chigh, Ilow, Ihigh in table:
-        if Clow <= C <= Chigh:
-            aqi = (Ihigh - Ilow) / (Chigh - Clow) * (C - Clow) + Ilow
-            return round(aqi)
-    return None
+    highs, segments = lookup
+    i = bisect_left(highs, C)
+    if i == len(highs):
+        return None
+    Clow, slope, Ilow = segments[i]
+    if C < Clow:
+        return None
+    return round(slope * (C - Clow) + Ilow)
 
 def calc_aqi(pm25: float | None, pm10: float | None) -> int | None:
-    aqi25 = calc_aqi_from_breakpoints(pm25, PM25_BREAKPOINTS) if pm25 is not None else None
-    aqi10 = calc_aqi_from_breakpoints(pm10, PM10_BREAKPOINTS) if pm10 is not None else None
+    aqi25 = calc_aqi_from_breakpoints(pm25, PM25_LOOKUP) if pm25 is not None else None
+    aqi10 = calc_aqi_from_breakpoints(pm10, PM10_LOOKUP) if pm10 is not None else None
     vals = [v for v in (aqi25, aqi10) if v is not None]
     if not vals:
         return None
     return max(vals)
 
+AQI_CATEGORY_BOUNDS = [50, 100, 150, 200, 300]
+AQI_CATEGORIES = (
+    ("Good", "0,255,128,220"),
+    ("Moderate", "255,220,0,220"),
+    ("Unhealthy for sensitive", "255,153,0,220"),
+    ("Unhealthy", "255,51,51,220"),
+    ("Very unhealthy", "186,85,211,220"),
+    ("Hazardous", "128,0,64,220"),
+)
+
 def category_and_color(aqi: int) -> tuple[str, str]:
-    if aqi <= 50:
-        return "Good", "0,255,128,220"
-    elif aqi <= 100:
-        return "Moderate", "255,220,0,220"
-    elif aqi <= 150:
-        return "Unhealthy for sensitive", "255,153,0,220"
-    elif aqi <= 200:
-        return "Unhealthy", "255,51,51,220"
-    elif aqi <= 300:
-        return "Very unhealthy", "186,85,211,220"
-    else:
-        return "Hazardous", "128,0,64,220"
+    return AQI_CATEGORIES[bisect_left(AQI_CATEGORY_BOUNDS, aqi)]
 
 def trend_icon(new: int | None, old: int | None) -> str:
     if new is None or old is None:
@@ -198,116 +396,294 @@ def trend_icon(new: int | None, old: int | None) -> str:
 
 # ========= STATE / HISTORY =========
 
+def parse_json(raw: bytes):
+    """Parses JSON bytes with orjson if available, stdlib json otherwise."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def dump_json(data) -> bytes:
+    """Serializes data to UTF-8 JSON bytes with orjson if available."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+_WRITTEN = {}          # path -> bytes last seen there (see write_if_changed)
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """
+    Writes data to path via a temp file + os.replace, so readers
+    such as Rainmeter never see a half-written file.
+    """
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def write_if_changed(path: Path, data: bytes) -> bool:
+    """
+    Writes data to path atomically (see write_atomic), unless path
+    already holds exactly these bytes. The last written bytes are
+    remembered, so a long-running process doesn't even re-read the file
+    (a deleted file is always written again).
+    Returns True if the file was written.
+    """
+    if not path.exists():
+        old = None
+    else:
+        old = _WRITTEN.get(path)
+        if old is None:
+            old = path.read_bytes()
+    if old != data:
+        write_atomic(path, data)
+    _WRITTEN[path] = data
+    return old != data
+
 def load_json(path: Path, default):
     if path.exists():
         try:
-            return json.loads(path.read_text(encoding="utf-8"))
+            return parse_json(path.read_bytes())
         except Exception:
             return default
     return default
 
 def save_json(path: Path, data) -> None:
-    path.write_text(json.dumps(data), encoding="utf-8")
+    write_if_changed(path, dump_json(data))
+
 
+HISTORY_FIELDS = ("ts", "aqi", "pm25", "pm10")
 
 def update_history(history: dict, key: str, ts: float, aqi: int | None,
                    pm25: float | None, pm10: float | None) -> None:
     """
-    Stores history in format:
+    Stores history column-wise (one list per field, same index = same sample):
     {
-      "home": [ {"ts": 1234567890.0, "aqi": 150, "pm25": 60, "pm10": 80}, ... ],
-      "vanya": [...]
+      "home": {"ts": [1234567890.0, ...], "aqi": [150, ...], "pm25": [60, ...], "pm10": [80, ...]},
+      "vanya": {...}
     }
     """
-    entries = history.get(key, [])
-    entries.append({
-        "ts": ts,
-        "aqi": aqi,
-        "pm25": pm25,
-        "pm10": pm10,
-    })
+    cols = history.get(key)
+    if cols is None:
+        cols = history[key] = {field: [] for field in HISTORY_FIELDS}
+    for field, value in zip(HISTORY_FIELDS, (ts, aqi, pm25, pm10)):
+        cols[field].append(value)
+
+    # Remove old entries; ts is in time order, so they are a prefix
+    stale = bisect_left(cols["ts"], ts - HOURS_HISTORY * 3600)
+    if stale:
+        for col in cols.values():
+            del col[:stale]
 
-    # Remove old entries
-    max_age = HOURS_HISTORY * 3600
-    entries = [e for e in entries if ts - e["ts"] <= max_age]
 
-    history[key] = entries
+def load_history(path: Path) -> dict:
+    """Loads history, converting the older list-of-entries format to columns."""
+    history = {}
+    for key, value in load_json(path, {}).items():
+        if isinstance(value, list):
+            value = {field: [e.get(field) for e in value] for field in HISTORY_FIELDS}
+        history[key] = value
+    return history
+
+def save_history(path: Path, history: dict) -> None:
+    save_json(path, history)
 
 
 # ========= GRAPHS =========
 
+_PLT = None            # matplotlib.pyplot, imported on first use (see get_plt)
+_FIG = None            # (fig, ax) reused by every matplotlib graph
+
+def get_plt():
+    """Imports matplotlib with the Agg backend once and returns pyplot."""
+    global _PLT
+    if _PLT is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        _PLT = plt
+    return _PLT
+
+def nice_step(span: float, target: int = 5) -> float:
+    """Rounds span / target up to 1, 2 or 5 x 10^k (tick spacing)."""
+    raw = span / target if span > 0 else 1.0
+    mag = 10 ** floor(log10(raw))
+    for m in (1, 2, 5):
+        if raw <= m * mag:
+            return m * mag
+    return 10 * mag
+
+def draw_graph_pillow(xs: list, ys: list, out_path: Path, label: str, color: str) -> None:
+    """Renders one AQI line graph as a transparent 450x220 PNG with Pillow."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = 450, 220
+    white = (255, 255, 255, 255)
+    faint = (255, 255, 255, 38)
+    try:
+        font = ImageFont.truetype("segoeui.ttf", 11)
+    except OSError:
+        font = ImageFont.load_default()
+
+    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+
+    def text_size(s: str) -> tuple[int, int]:
+        l, t, r, b = draw.textbbox((0, 0), s, font=font)
+        return r - l, b - t
+
+    # Plot area and axis ranges
+    x0, x1 = 44, width - 10
+    y0, y1 = height - 34, 10
+    y_step = nice_step(max(ys) - min(ys))
+    y_lo = floor(min(ys) / y_step) * y_step
+    y_hi = max(ceil(max(ys) / y_step) * y_step, y_lo + y_step)
+    x_step = nice_step(HOURS_HISTORY)
+
+    def px(x: float) -> float:
+        return x0 + (x1 - x0) * x / HOURS_HISTORY
+
+    def py(y: float) -> float:
+        return y0 - (y0 - y1) * (y - y_lo) / (y_hi - y_lo)
+
+    # Grid + tick labels (white)
+    for i in range(int(HOURS_HISTORY // x_step) + 1):
+        x = i * x_step
+        draw.line([(px(x), y1), (px(x), y0)], fill=faint)
+        s = f"{x:g}"
+        w, h = text_size(s)
+        draw.text((px(x) - w / 2, y0 + 4), s, font=font, fill=white)
+    for i in range(round((y_hi - y_lo) / y_step) + 1):
+        y = y_lo + i * y_step
+        draw.line([(x0, py(y)), (x1, py(y))], fill=faint)
+        s = f"{round(y, 6):g}"
+        w, h = text_size(s)
+        draw.text((x0 - w - 5, py(y) - h / 2 - 2), s, font=font, fill=white)
+
+    # Axis labels (white)
+    s = f"Hours (last {HOURS_HISTORY}h)"
+    w, h = text_size(s)
+    draw.text(((x0 + x1 - w) / 2, height - h - 4), s, font=font, fill=white)
+    w, h = text_size("AQI")
+    ylabel = Image.new("RGBA", (w + 2, h + 4), (0, 0, 0, 0))
+    ImageDraw.Draw(ylabel).text((0, 0), "AQI", font=font, fill=white)
+    ylabel = ylabel.rotate(90, expand=True)
+    img.alpha_composite(ylabel, (0, int((y0 + y1 - ylabel.height) / 2)))
+
+    # Border (white)
+    draw.rectangle([x0, y1, x1, y0], outline=white)
+
+    # Data
+    points = [(px(x), py(y)) for x, y in zip(xs, ys)]
+    if len(points) > 1:
+        draw.line(points, fill=color, width=2, joint="curve")
+    else:
+        (cx, cy), = points
+        draw.ellipse([cx - 2, cy - 2, cx + 2, cy + 2], fill=color)
+
+    # Legend
+    w, h = text_size(label)
+    lx, ly = x0 + 6, y1 + 6
+    draw.rectangle([lx, ly, lx + w + 36, ly + h + 10], fill=(255, 255, 255, 204))
+    draw.line([(lx + 5, ly + (h + 10) / 2), (lx + 25, ly + (h + 10) / 2)], fill=color, width=2)
+    draw.text((lx + 30, ly + 3), label, font=font, fill=(0, 0, 0, 255))
+
+    img.save(out_path, "PNG", optimize=True)
+
+def draw_graph_matplotlib(xs: list, ys: list, out_path: Path, label: str, color: str) -> None:
+    """
+    Renders one AQI line graph as a transparent PNG with matplotlib.
+    The figure is created once and cleared for every graph.
+    """
+    global _FIG
+    if _FIG is None:
+        _FIG = get_plt().subplots(figsize=(4.5, 2.2), dpi=100)
+    fig, ax = _FIG
+    ax.clear()
+
+    ax.plot(xs, ys, color=color, linewidth=1.8, label=label)
+
+    ax.set_xlim(0, HOURS_HISTORY)
+
+    # Axis labels (white)
+    ax.set_xlabel("Hours (last 24h)", fontsize=8, color="white")
+    ax.set_ylabel("AQI", fontsize=8, color="white")
+
+    # Axis ticks (white)
+    ax.tick_params(axis="x", colors="white")
+    ax.tick_params(axis="y", colors="white")
+
+    # Border (white)
+    for spine in ax.spines.values():
+        spine.set_color("white")
+
+    # Grid
+    ax.grid(True, linestyle="--", linewidth=0.5, alpha=0.15, color="white")
+
+    # Legend
+    leg = ax.legend(fontsize=8, loc="upper left")
+    for text in leg.get_texts():
+        text.set_color("black")
+
+    ax.set_facecolor("none")
+    fig.patch.set_alpha(0.0)
+
+    fig.tight_layout()
+    fig.savefig(out_path, transparent=True)
+
+def graph_drawer():
+    """
+    Returns the draw_graph_* function for GRAPH_BACKEND, or the other
+    backend if its package is not installed, or None if neither is.
+    """
+    backends = ["pillow", "matplotlib"]
+    if GRAPH_BACKEND == "matplotlib":
+        backends.reverse()
+
+    for backend in backends:
+        try:
+            if backend == "pillow":
+                import PIL.ImageDraw
+                return draw_graph_pillow
+            get_plt()
+            return draw_graph_matplotlib
+        except ImportError:
+            continue
+    return None
+
 def save_daily_graph(history: dict) -> None:
     """
     Draws two PNG graphs of AQI for the past HOURS_HISTORY hours:
     - one for "home"
     - one for "vanya"
     """
-    try:
-        import matplotlib
-        matplotlib.use("Agg")
-        import matplotlib.pyplot as plt
-    except ImportError:
-        print("[GRAPH] matplotlib not installed, skipping")
+    draw_graph = graph_drawer()
+    if draw_graph is None:
+        print("[GRAPH] neither Pillow nor matplotlib installed, skipping")
         return
 
     now_ts = datetime.now(timezone.utc).timestamp()
     left_ts = now_ts - HOURS_HISTORY * 3600
 
     def make_graph_for(key: str, out_path: Path, label: str, color: str):
-        entries = history.get(key, [])
-        if not entries:
+        cols = history.get(key)
+        if not cols or not cols["ts"]:
             print(f"[GRAPH] No data for {key}")
             return
 
+        # ts is in time order: the window is a suffix of the columns
+        start = bisect_left(cols["ts"], left_ts)
         xs = []
         ys = []
-        for e in entries:
-            ts = e.get("ts")
-            aqi = e.get("aqi")
-            if ts is None or aqi is None:
-                continue
-            if ts < left_ts:
+        for ts, aqi in zip(cols["ts"][start:], cols["aqi"][start:]):
+            if aqi is None:
                 continue
-            x = (ts - left_ts) / 3600.0
-            xs.append(x)
+            xs.append((ts - left_ts) / 3600.0)
             ys.append(aqi)
 
         if not xs or not ys:
             print(f"[GRAPH] Insufficient data for {key}")
             return
 
-        fig, ax = plt.subplots(figsize=(4.5, 2.2), dpi=100)
-
-        ax.plot(xs, ys, color=color, linewidth=1.8, label=label)
-
-        ax.set_xlim(0, HOURS_HISTORY)
-
-        # Axis labels (white)
-        ax.set_xlabel("Hours (last 24h)", fontsize=8, color="white")
-        ax.set_ylabel("AQI", fontsize=8, color="white")
-
-        # Axis ticks (white)
-        ax.tick_params(axis="x", colors="white")
-        ax.tick_params(axis="y", colors="white")
-
-        # Border (white)
-        for spine in ax.spines.values():
-            spine.set_color("white")
-
-        # Grid
-        ax.grid(True, linestyle="--", linewidth=0.5, alpha=0.15, color="white")
-
-        # Legend
-        leg = ax.legend(fontsize=8, loc="upper left")
-        for text in leg.get_texts():
-            text.set_color("black")
-
-        ax.set_facecolor("none")
-        fig.patch.set_alpha(0.0)
-
-        fig.tight_layout()
-        fig.savefig(out_path, transparent=True)
-        plt.close(fig)
+        draw_graph(xs, ys, out_path, label, color)
         print(f"[GRAPH] saved {out_path}")
 
     make_graph_for(
@@ -327,24 +703,44 @@ def save_daily_graph(history: dict) -> None:
 
 # ========= MAIN =========
 
-def main():
-    prev_state = load_json(STATE_FILE, {})
-    history = load_json(HISTORY_FILE, {})
+# Rainmeter variables written to VARS_FILE for each location
+VARS_TEMPLATE = (
+    "AQI_{prefix}={aqi}\n"
+    "AQI_{prefix}Color={color}\n"
+    "AQI_{prefix}TrendIcon={icon}\n"
+    "AQI_{prefix}Category={cat}\n"
+    "AQI_{prefix}Name={name}\n"
+    "{prefix}_PM25={pm25}\n"
+    "{prefix}_PM10={pm10}\n"
+)
 
+def tick(prev_state: dict, history: dict, persist_history: bool = True) -> dict:
+    """
+    One update: fetches all locations, writes VARS_FILE / STATE_FILE
+    (and HISTORY_FILE if persist_history), redraws the graphs.
+    history is updated in place.
+    Returns the new state (the prev_state of the next tick).
+    """
     now = datetime.now(timezone.utc)
     now_iso = now.replace(microsecond=0).isoformat()
     now_ts = now.timestamp()
 
-    lines = ["[Variables]"]
+    parts = ["[Variables]\n"]
     new_state: dict = {}
 
+    # Fetch all locations in parallel (network-bound), keep output order
+    with ThreadPoolExecutor(max_workers=len(LOCATIONS)) as ex:
+        futures = {
+            key: ex.submit(fetch_sensor_data, cfg["lat"], cfg["lon"],
+                           sensor_id=cfg.get("sensor_id"), radius_km=RADIUS_KM,
+                           trig=LOCATION_TRIG[key])
+            for key, cfg in LOCATIONS.items()
+        }
+
     for key, cfg in LOCATIONS.items():
-        lat = cfg["lat"]
-        lon = cfg["lon"]
         name = cfg["name"]
-        sensor_id = cfg.get("sensor_id")
 
-        pm25, pm10 = fetch_sensor_data(lat, lon, sensor_id=sensor_id, radius_km=RADIUS_KM)
+        pm25, pm10 = futures[key].result()
         aqi = calc_aqi(pm25, pm10)
 
         old_aqi = prev_state.get(key, {}).get("aqi")
@@ -362,25 +758,92 @@ def main():
 
         update_history(history, key, now_ts, aqi, pm25, pm10)
 
-        prefix = key.capitalize()
-        lines.append(f"AQI_{prefix}={aqi_str}")
-        lines.append(f"AQI_{prefix}Color={color}")
-        lines.append(f"AQI_{prefix}TrendIcon={icon}")
-        lines.append(f"AQI_{prefix}Category={cat}")
-        lines.append(f"AQI_{prefix}Name={name}")
-        lines.append(f"{prefix}_PM25={pm25 if pm25 is not None else '-'}")
-        lines.append(f"{prefix}_PM10={pm10 if pm10 is not None else '-'}")
+        parts.append(VARS_TEMPLATE.format(
+            prefix=key.capitalize(),
+            aqi=aqi_str,
+            color=color,
+            icon=icon,
+            cat=cat,
+            name=name,
+            pm25=pm25 if pm25 is not None else "-",
+            pm10=pm10 if pm10 is not None else "-",
+        ))
 
-    lines.append(f"AQI_LastUpdateUTC={now_iso}")
+    parts.append(f"AQI_LastUpdateUTC={now_iso}\n")
 
-    VARS_FILE.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    write_if_changed(VARS_FILE, "".join(parts).encode("utf-8"))
     save_json(STATE_FILE, new_state)
-    save_json(HISTORY_FILE, history)
+    if persist_history:
+        save_history(HISTORY_FILE, history)
 
     print(">>> GENERATING GRAPH IMAGES <<<")
 
     save_daily_graph(history)
 
+    return new_state
+
+
+def refresh_rainmeter() -> None:
+    """Asks Rainmeter to reload its skins so they pick up the new aqi_data.inc."""
+    for base in (os.environ.get("ProgramFiles"), os.environ.get("ProgramFiles(x86)")):
+        if not base:
+            continue
+        exe = Path(base) / "Rainmeter" / "Rainmeter.exe"
+        if exe.exists():
+            subprocess.run([str(exe), "!RefreshApp"], check=False)
+            return
+    print("[WARN] Rainmeter.exe not found, skipping refresh")
+
+
+def main():
+    """Single update, e.g. for a scheduler (run with --once)."""
+    prev_state = load_json(STATE_FILE, {})
+    history = load_history(HISTORY_FILE)
+    tick(prev_state, history)
+
+
+def loop():
+    """
+    Runs forever, updating every UPDATE_INTERVAL seconds.
+    Imports, the HTTP session, graph backends and state/history stay
+    in memory between ticks, so startup costs are paid once.
+    History is only written every HISTORY_SAVE_EVERY ticks, plus on a
+    clean exit (Ctrl+C, SIGTERM where delivered). Windows shutdown, logoff
+    or Task Manager end the process without that, losing up to
+    HISTORY_SAVE_EVERY - 1 ticks of history.
+    """
+    sys.stdout.reconfigure(line_buffering=True)
+
+    # Turn catchable termination requests into SystemExit, so the finally
+    # block below saves the history (best effort, see docstring)
+    for name in ("SIGTERM", "SIGBREAK"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda signum, frame: sys.exit(0))
+
+    prev_state = load_json(STATE_FILE, {})
+    history = load_history(HISTORY_FILE)
+    ticks = 0
+
+    try:
+        while True:
+            started = time.monotonic()
+            ticks += 1
+            print(f"[LOOP {datetime.now().replace(microsecond=0).isoformat()}]")
+            try:
+                prev_state = tick(prev_state, history,
+                                  persist_history=ticks % HISTORY_SAVE_EVERY == 0)
+            except Exception as e:
+                print(f"[ERROR] update failed: {e!r}")
+            else:
+                refresh_rainmeter()
+            time.sleep(max(0.0, UPDATE_INTERVAL - (time.monotonic() - started)))
+    finally:
+        save_history(HISTORY_FILE, history)
+        print("[LOOP] history saved, exiting")
+
 
 if __name__ == "__main__":
-    main()
+    if "--once" in sys.argv[1:]:
+        main()
+    else:
+        loop()